@@ -1,59 +1,178 @@
+import hashlib
 import os
+import shutil
 import sys
+import time
+import urllib.error
 import urllib.request
 import zipfile
 
 FFMPEG_URL = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
+# gyan.dev 在压缩包旁边发布 SHA-256 校验文件
+CHECKSUM_URL = FFMPEG_URL + ".sha256"
 ZIP_NAME = "ffmpeg-release-essentials.zip"
 TARGET_EXE = "ffmpeg.exe"
+CHUNK_SIZE = 1 << 16
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 3  # seconds
+TIMEOUT = 30  # seconds
 
-def download_with_progress(url, filename):
-    def show_progress(block_num, block_size, total_size):
-        downloaded = block_num * block_size
-        percent = min(100, downloaded * 100 // total_size)
-        print(f"\r下载进度: {percent}%", end="")
-    print(f"正在下载: {url}")
+def get_cache_dir():
+    # 多个项目目录共用一个下载缓存，可用环境变量 TIMELAPSE_CACHE_DIR 指定
+    cache_dir = os.environ.get("TIMELAPSE_CACHE_DIR")
+    if not cache_dir:
+        base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base, "TimeLapseOnPC")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def fetch_expected_sha256(url=CHECKSUM_URL, timeout=TIMEOUT):
+    # 校验文件内容为 "<hex>" 或 "<hex>  文件名"，取不到时返回 None
     try:
-        urllib.request.urlretrieve(url, filename, show_progress)
-        print("\n下载完成!")
-        return True
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            text = resp.read(1024).decode("ascii", "ignore").strip()
     except Exception as e:
-        print(f"\n下载失败: {e}")
-        return False
+        print(f"无法获取校验值: {e}")
+        return None
+    digest = text.split()[0].lower() if text else ""
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        print(f"校验文件格式无法识别: {text[:80]}")
+        return None
+    return digest
+
+def sha256_of_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def show_progress(downloaded, total_size):
+    # 服务器没有返回文件大小时只显示已下载量
+    if total_size:
+        percent = min(100, downloaded * 100 // total_size)
+        print(f"\r下载进度: {percent}% ({downloaded / 1048576:.1f}/{total_size / 1048576:.1f} MB)", end="")
+    else:
+        print(f"\r已下载: {downloaded / 1048576:.1f} MB", end="")
+
+def download_with_progress(url, filename, max_attempts=MAX_ATTEMPTS, timeout=TIMEOUT):
+    # 先写入 filename + '.part'，中断后重新运行会用 HTTP Range 从断点继续，
+    # 完整下载后才改名为 filename
+    part = filename + ".part"
+    print(f"正在下载: {url}")
+    for attempt in range(1, max_attempts + 1):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header("Range", f"bytes={offset}-")
+            print(f"从 {offset / 1048576:.1f} MB 处继续下载...")
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                if offset and resp.status != 206:
+                    # 服务器不支持断点续传，从头开始
+                    offset = 0
+                total_size = None
+                content_range = resp.headers.get("Content-Range")
+                if content_range and "/" in content_range and not content_range.endswith("/*"):
+                    total_size = int(content_range.rsplit("/", 1)[1])
+                elif resp.headers.get("Content-Length"):
+                    total_size = offset + int(resp.headers["Content-Length"])
+                downloaded = offset
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in iter(lambda: resp.read(CHUNK_SIZE), b""):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+                        show_progress(downloaded, total_size)
+                if total_size is not None and downloaded < total_size:
+                    raise IOError(f"连接提前断开 ({downloaded}/{total_size} 字节)")
+            os.replace(part, filename)
+            print("\n下载完成!")
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:
+                # 断点已在文件末尾（或超出），说明 .part 已完整或已损坏，交给校验判断
+                os.replace(part, filename)
+                print("\n下载完成!")
+                return True
+            print(f"\n下载失败: {e}")
+        except Exception as e:
+            print(f"\n下载失败: {e}")
+        if attempt < max_attempts:
+            print(f"{RETRY_DELAY} 秒后重试 ({attempt + 1}/{max_attempts})...")
+            time.sleep(RETRY_DELAY)
+    return False
 
 def extract_ffmpeg_exe(zip_path, target_dir):
+    # 只读取 zip 的中央目录定位 ffmpeg.exe，再把这一个成员流式解压到目标位置，
+    # 不解压其余文件，也不产生完整的临时目录
     print("正在解压 ffmpeg.exe ...")
+    dst = os.path.join(target_dir, TARGET_EXE)
+    tmp = dst + ".tmp"
     try:
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            for member in zip_ref.namelist():
-                if member.endswith('/ffmpeg.exe'):
-                    zip_ref.extract(member, target_dir)
-                    src = os.path.join(target_dir, member)
-                    dst = os.path.join(target_dir, TARGET_EXE)
-                    os.replace(src, dst)
+            for info in zip_ref.infolist():
+                if info.filename.endswith('/ffmpeg.exe'):
+                    with zip_ref.open(info) as src, open(tmp, "wb") as out:
+                        shutil.copyfileobj(src, out, CHUNK_SIZE)
+                    os.replace(tmp, dst)
                     print(f"已提取: {dst}")
                     return True
         print("未找到 ffmpeg.exe！请手动解压。")
         return False
     except Exception as e:
         print(f"解压失败: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
         return False
 
+def fetch_ffmpeg_zip(url=FFMPEG_URL, cache_dir=None, expected_sha256=None, checksum_url=None):
+    # 返回缓存中已校验的压缩包路径，失败时返回 None
+    # checksum_url 默认为 url + ".sha256"（与 url 同源），传 False 则不获取校验值
+    cache_dir = cache_dir or get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    zip_path = os.path.join(cache_dir, ZIP_NAME)
+    if checksum_url is None:
+        checksum_url = url + ".sha256"
+    if expected_sha256 is None and checksum_url:
+        expected_sha256 = fetch_expected_sha256(checksum_url)
+    if expected_sha256 is None:
+        print("警告: 没有可用的校验值，跳过完整性校验。")
+    if os.path.exists(zip_path):
+        if expected_sha256 is None or sha256_of_file(zip_path) == expected_sha256:
+            print(f"使用缓存: {zip_path}")
+            return zip_path
+        print("缓存的压缩包已过期或损坏，重新下载。")
+        os.remove(zip_path)
+    if not download_with_progress(url, zip_path):
+        return None
+    if expected_sha256 is not None:
+        actual = sha256_of_file(zip_path)
+        if actual != expected_sha256:
+            print(f"校验失败: 期望 {expected_sha256}，实际 {actual}")
+            os.remove(zip_path)
+            return None
+        print("SHA-256 校验通过。")
+    return zip_path
+
 def main():
     if os.path.exists(TARGET_EXE):
         print(f"{TARGET_EXE} 已存在，无需重复下载。")
         sys.exit(0)
-    if not download_with_progress(FFMPEG_URL, ZIP_NAME):
+    zip_path = fetch_ffmpeg_zip()
+    if zip_path is None:
         print("\nDownload failed. Please check your network and try again.")
         sys.exit(1)
-    success = extract_ffmpeg_exe(ZIP_NAME, os.getcwd())
-    os.remove(ZIP_NAME)
+    # 压缩包保留在共享缓存中，供其他项目目录复用
+    success = extract_ffmpeg_exe(zip_path, os.getcwd())
     if success:
         print("ffmpeg.exe 下载并解压完成！")
         sys.exit(0)
     else:
+        # 压缩包可能已损坏（例如没有校验值时），删除缓存，下次运行重新下载
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
         print("Download or extraction failed. Please restart this script. If the problem persists, manually download ffmpeg.exe and place it in the project root directory.")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,203 @@
+import mmap
+import os
+import threading
+import cv2
+import numpy as np
+
+# 分块存储：把编码后的图片依次追加到大文件中，避免一个目录里几十万个小文件。
+# 目录结构：
+#     frames_00000.bin, frames_00001.bin, ...  数据块，每个约chunk_size字节
+#     frames.idx                              索引，每行 "文件名\t块号\t偏移\t长度"
+# 先写数据再写索引，程序中断时最多丢失最后一帧的索引，已写入的帧不受影响。
+INDEX_NAME = "frames.idx"
+CHUNK_NAME = "frames_{:05d}.bin"
+DEFAULT_CHUNK_SIZE = 1 << 30
+
+def chunk_path(store_dir, chunk_no):
+    return os.path.join(store_dir, CHUNK_NAME.format(chunk_no))
+
+class ChunkWriter:
+    """
+    向分块存储追加帧。可在多个写图线程中同时调用append。
+    目录中已有数据时接着最后一个数据块继续写。
+    """
+    def __init__(self, store_dir, chunk_size=DEFAULT_CHUNK_SIZE, flush_every=32):
+        self.store_dir = store_dir
+        self.chunk_size = chunk_size
+        os.makedirs(store_dir, exist_ok=True)
+        chunk_no = 0
+        while os.path.exists(chunk_path(store_dir, chunk_no + 1)):
+            chunk_no += 1
+        self._lock = threading.Lock()
+        self._flush_every = flush_every
+        self._pending = 0
+        self._open_chunk(chunk_no)
+        index_path = os.path.join(store_dir, INDEX_NAME)
+        self._repair_index(index_path)
+        self._index = open(index_path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def _repair_index(index_path):
+        # 上次中断时索引可能停在半行，截掉它，否则接着写的第一行会拼在后面而无法读取
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'rb+') as f:
+            # 从文件末尾向前找最后一个换行，不读入整个索引
+            size = end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end != size:
+                f.truncate(end)
+
+    def _open_chunk(self, chunk_no):
+        path = chunk_path(self.store_dir, chunk_no)
+        self._chunk_no = chunk_no
+        # 不缓冲：帧数据本身就很大，而且写入失败后可以从文件位置得到真实偏移
+        self._chunk = open(path, 'ab', buffering=0)
+        self._offset = os.path.getsize(path)
+
+    def _write_all(self, data):
+        view = memoryview(data).cast('B')
+        while view:
+            written = self._chunk.write(view)
+            view = view[written:]
+
+    def append(self, name, data):
+        """
+        追加一帧。
+        参数：
+            name: 帧的文件名（导出时使用，生成视频时用于排序和读取拍摄时间）
+            data: 编码后的图片数据（bytes或支持缓冲区协议的对象）
+        """
+        length = len(data)
+        with self._lock:
+            if self._offset and self._offset + length > self.chunk_size:
+                self._chunk.close()
+                self._open_chunk(self._chunk_no + 1)
+            try:
+                self._write_all(data)
+            except OSError:
+                # 可能写入了一部分，后续帧从实际文件末尾继续，这一帧不写索引
+                self._offset = self._chunk.seek(0, os.SEEK_END)
+                raise
+            offset = self._offset
+            self._offset += length
+            self._index.write(f"{name}\t{self._chunk_no}\t{offset}\t{length}\n")
+            self._pending += 1
+            if self._pending >= self._flush_every:
+                self._flush()
+
+    def _flush(self):
+        self._index.flush()
+        self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._chunk.close()
+            self._index.close()
+
+class ChunkReader:
+    """
+    读取分块存储。数据块通过mmap映射，read_bytes返回映射上的memoryview切片，
+    imread直接在该切片上解码，不复制数据。
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self._entries = {}
+        with open(os.path.join(store_dir, INDEX_NAME), encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                if len(parts) != 4:
+                    # 中断时可能留下不完整的最后一行
+                    continue
+                name, chunk_no, offset, length = parts
+                self._entries[name] = (int(chunk_no), int(offset), int(length))
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def names(self):
+        return list(self._entries)
+
+    def _map(self, chunk_no, needed):
+        with self._lock:
+            mm = self._maps.get(chunk_no)
+            if mm is None or len(mm) < needed:
+                # 拍摄可能还在向这个数据块追加，按当前大小重新映射
+                with open(chunk_path(self.store_dir, chunk_no), 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[chunk_no] = mm
+            return mm
+
+    def read_bytes(self, name):
+        chunk_no, offset, length = self._entries[name]
+        mm = self._map(chunk_no, offset + length)
+        return memoryview(mm)[offset:offset + length]
+
+    def imread(self, name, flags=cv2.IMREAD_COLOR):
+        return cv2.imdecode(np.frombuffer(self.read_bytes(name), dtype=np.uint8), flags)
+
+    def export(self, dest_dir, start=0, stop=None, log_func=print):
+        """
+        把一段帧导出为单独的图片文件。
+        参数：
+            dest_dir: 导出目录
+            start, stop: 按文件名排序后的帧序号范围，同切片规则
+            log_func: 日志输出函数，默认为print
+        返回：
+            导出的帧数
+        """
+        os.makedirs(dest_dir, exist_ok=True)
+        names = sorted(self._entries)[start:stop]
+        for name in names:
+            with open(os.path.join(dest_dir, name), 'wb') as f:
+                f.write(self.read_bytes(name))
+        log_func(f"已导出 {len(names)} 张照片到 {dest_dir}")
+        return len(names)
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+def open_store(store_dir, reload=False):
+    """
+    打开目录中的分块存储，同一进程内复用同一个ChunkReader。
+    参数：
+        store_dir: 目录
+        reload: 重新读取索引（拍摄仍在进行或之后又追加过帧时使用）
+    返回：
+        ChunkReader，目录中没有分块存储时返回None
+    """
+    key = os.path.abspath(store_dir)
+    with _readers_lock:
+        if reload or key not in _readers:
+            exists = os.path.exists(os.path.join(store_dir, INDEX_NAME))
+            _readers[key] = ChunkReader(store_dir) if exists else None
+        return _readers[key]
+
+if __name__ == "__main__":
+    store_directory = input("请输入分块存储目录: ").strip()
+    reader = open_store(store_directory)
+    if reader is None:
+        print("该目录中没有分块存储！")
+    else:
+        print(f"共 {len(reader)} 张照片")
+        export_directory = input("请输入导出目录: ").strip()
+        try:
+            start = int(input("起始序号（默认0）: ").strip() or "0")
+            stop_text = input("结束序号（不含，默认到最后）: ").strip()
+            stop = int(stop_text) if stop_text else None
+            reader.export(export_directory, start, stop)
+        except ValueError:
+            print("请输入有效的整数！")
@@ -1,52 +1,299 @@
 import os
 import cv2
+import numpy as np
 import re
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+from frame_chunks import open_store
+from photo_capture import calc_timestamp_params, add_timestamp_to_image, read_frame_stats
+from timelapse_common import parse_filters
+
+# High-rate capture names are fixed width, so lexical order is capture order
+# Format: photo_2025-07-04_15-38-59-123Z_00000168.jpg (UTC, so a DST
+# rollback cannot reorder them; older local-time names have no Z)
+HIGH_RATE_NAME_PATTERN = re.compile(r'photo_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}-\d{3}Z?_\d{8}\.')
 
 def get_timestamp_from_filename(filename):
     # Extract timestamp and index from filename
     # Support format: photo_2025-07-04_23-38-59_168.jpg
-    match = re.match(r'photo_(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})_(\d+)', filename)
+    # and high-rate format: photo_2025-07-04_15-38-59-123Z_00000168.jpg
+    # A trailing Z marks UTC; the result is always naive local time
+    match = re.match(r'photo_(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})(?:-(\d{3})(Z)?)?_(\d+)', filename)
     if match:
-        year, month, day, hour, minute, second, index = match.groups()
-        timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+        year, month, day, hour, minute, second, millis, utc, index = match.groups()
+        timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                             int(millis or 0) * 1000)
+        if utc:
+            timestamp = timestamp.replace(tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
         return timestamp, int(index)
     return None, None
 
-def create_timelapse(input_dir, output_file, fps=24):
+def get_label_from_filename(filename):
+    # Build the overlay label from the capture time encoded in the filename,
+    # in the same format capture uses when stamping frames directly
+    timestamp, _ = get_timestamp_from_filename(filename)
+    if timestamp is None:
+        return None
+    label = timestamp.strftime("%Y-%m-%d_%H:%M:%S")
+    if HIGH_RATE_NAME_PATTERN.match(filename):
+        label += f".{timestamp.microsecond // 1000:03d}"
+    return label
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+def list_frames(input_dir):
+    # Loose image files plus frames held in a chunk store in the same directory
+    names = [f for f in os.listdir(input_dir) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    store = open_store(input_dir, reload=True)
+    if store is not None:
+        loose = set(names)
+        names.extend(name for name in store.names() if name not in loose)
+    return names
+
+def read_image(input_dir, filename, flags=cv2.IMREAD_COLOR):
+    # Chunk-store frames are decoded straight from the memory-mapped chunk
+    store = open_store(input_dir)
+    if store is not None and filename in store:
+        return store.imread(filename, flags)
+    return cv2.imread(os.path.join(input_dir, filename), flags)
+
+FILTER_OPS = {
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '<': np.less,
+    '<=': np.less_equal,
+}
+
+def filter_by_stats(input_dir, filenames, filters):
+    # Drop frames using the capture-time stats sidecar, without decoding anything.
+    # Frames that have no recorded stats are kept.
+    names, columns = read_frame_stats(input_dir)
+    if names is None:
+        print("未找到画面统计文件，跳过过滤。")
+        return filenames
+    keep = np.ones(len(names), dtype=bool)
+    for column, op, value in parse_filters(filters):
+        keep &= FILTER_OPS[op](columns[column], value)
+    rejected = {name for name, ok in zip(names, keep) if not ok}
+    kept = [f for f in filenames if f not in rejected]
+    print(f"按画面统计过滤：保留 {len(kept)} / {len(filenames)} 张")
+    return kept
+
+# Stabilization works on grayscale proxies decoded at 1/4 scale; JPEG can
+# decode directly at that scale, which is far cheaper than a full decode
+STABILIZE_PROXY_SCALE = 4
+
+def read_proxy(input_dir, filename, proxy_size):
+    proxy = read_image(input_dir, filename, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if proxy is None:
+        return None
+    if (proxy.shape[1], proxy.shape[0]) != proxy_size:
+        proxy = cv2.resize(proxy, proxy_size, interpolation=cv2.INTER_AREA)
+    return np.float32(proxy)
+
+def estimate_shifts_chunk(input_dir, filenames, anchor_name, proxy_size, mode):
+    # Runs in a worker process. In 'reference' mode every shift is measured
+    # against anchor_name (the first frame); in 'rolling' mode each frame is
+    # measured against the one before it, anchor_name being the frame that
+    # precedes this chunk. Unreadable frames report (0, 0).
+    window = cv2.createHanningWindow(proxy_size, cv2.CV_32F)
+    anchor = read_proxy(input_dir, anchor_name, proxy_size) if anchor_name else None
+    shifts = []
+    for filename in filenames:
+        proxy = read_proxy(input_dir, filename, proxy_size)
+        if proxy is None or anchor is None:
+            shifts.append((0.0, 0.0))
+        else:
+            (dx, dy), _ = cv2.phaseCorrelate(anchor, proxy, window)
+            shifts.append((dx, dy))
+        if mode == 'rolling' and proxy is not None:
+            anchor = proxy
+    return shifts
+
+def smooth_trajectory(trajectory, radius):
+    # Centered moving average over 2 * radius + 1 frames, edges padded
+    if radius <= 0 or len(trajectory) < 2:
+        return trajectory
+    kernel = np.ones(2 * radius + 1) / (2 * radius + 1)
+    padded = np.pad(trajectory, ((radius, radius), (0, 0)), mode='edge')
+    return np.stack([np.convolve(padded[:, k], kernel, mode='valid') for k in range(2)], axis=1)
+
+def compute_stabilization(input_dir, filenames, size, mode='reference', smooth_radius=5, workers=None):
+    # Returns one (dx, dy) correction per frame, in output pixels.
+    # Only the N x 2 offsets are kept in memory, frames are streamed from disk.
+    workers = workers or os.cpu_count() or 1
+    proxy_size = (max(1, size[0] // STABILIZE_PROXY_SCALE), max(1, size[1] // STABILIZE_PROXY_SCALE))
+    chunk = max(1, -(-len(filenames) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        for start in range(0, len(filenames), chunk):
+            if mode == 'rolling':
+                anchor = filenames[start - 1] if start > 0 else filenames[0]
+            else:
+                anchor = filenames[0]
+            futures.append(pool.submit(estimate_shifts_chunk, input_dir, filenames[start:start + chunk], anchor,
+                                       proxy_size, mode))
+        shifts = np.array([shift for future in futures for shift in future.result()], dtype=np.float64)
+    shifts *= (size[0] / proxy_size[0], size[1] / proxy_size[1])
+    if mode == 'rolling':
+        # Pairwise shifts add up to the camera path; follow its smoothed
+        # version so slow intended drift stays and jitter is removed
+        trajectory = np.cumsum(shifts, axis=0)
+        return smooth_trajectory(trajectory, smooth_radius) - trajectory
+    # Locked to the first frame: each shift is already the full offset to undo.
+    # Not smoothed, since the jitter is exactly the high-frequency part
+    return -shifts
+
+class FrameMerger:
+    # Rolling merge of the last `window` frames for long-exposure looks:
+    #   'mean'  - running int32 sum; add the new frame, subtract the oldest
+    #   'max'   - light trails; van Herk/Gil-Werman block maxima, amortized O(1).
+    #             At each block boundary the ring is overwritten in place with the
+    #             previous block's suffix maxima, so memory stays at K frames
+    #   'decay' - exponential blend, older frames fade out (alpha = 2 / (window + 1))
+    # All buffers are allocated once from the first frame. push() returns a
+    # reused output buffer that is only valid until the next call.
+    MODES = ('mean', 'max', 'decay')
+
+    def __init__(self, mode='mean', window=5):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown merge mode: {mode}")
+        self.mode = mode
+        self.window = max(1, int(window))
+        self.count = 0
+
+    def _allocate(self, frame):
+        k = self.window
+        self.out = np.empty_like(frame)
+        if self.mode == 'mean':
+            self.ring = np.empty((k,) + frame.shape, dtype=frame.dtype)
+            self.acc = np.zeros(frame.shape, dtype=np.int32)
+        elif self.mode == 'max':
+            self.ring = np.empty((k,) + frame.shape, dtype=frame.dtype)
+            self.prefix = np.empty_like(frame)
+        else:
+            self.acc = np.float32(frame)
+
+    def push(self, frame):
+        if self.count == 0:
+            self._allocate(frame)
+        k = self.window
+        pos = self.count % k
+        if self.mode == 'mean':
+            if self.count >= k:
+                np.subtract(self.acc, self.ring[pos], out=self.acc)
+            np.add(self.acc, frame, out=self.acc)
+            self.ring[pos] = frame
+            cv2.convertScaleAbs(self.acc, self.out, 1.0 / min(self.count + 1, k))
+        elif self.mode == 'max':
+            if pos == 0:
+                if self.count > 0:
+                    # The ring now holds exactly the previous block; only its suffix
+                    # maxima are needed from here on, so compute them in place
+                    for j in range(k - 2, -1, -1):
+                        np.maximum(self.ring[j], self.ring[j + 1], out=self.ring[j])
+                self.prefix[...] = frame
+            else:
+                np.maximum(self.prefix, frame, out=self.prefix)
+            self.ring[pos] = frame
+            if self.count >= k and pos < k - 1:
+                # Window = tail of the previous block + current block so far
+                np.maximum(self.ring[pos + 1], self.prefix, out=self.out)
+            else:
+                self.out[...] = self.prefix
+        else:
+            if self.count > 0:
+                cv2.accumulateWeighted(frame, self.acc, 2.0 / (k + 1))
+            cv2.convertScaleAbs(self.acc, self.out)
+        self.count += 1
+        return self.out
+
+def decode_frame(input_dir, filename, size, label=None, label_params=None, shift=None):
+    # Runs in a decode worker: read, fit to the output size, stabilize, draw the label
+    frame = read_image(input_dir, filename)
+    if frame is None:
+        return None
+    if (frame.shape[1], frame.shape[0]) != size:
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if shift is not None:
+        matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+        frame = cv2.warpAffine(frame, matrix, size, borderMode=cv2.BORDER_REPLICATE)
+    if label is not None:
+        frame = add_timestamp_to_image(frame, label, label_params)
+    return frame
+
+def iter_decoded_frames(input_dir, filenames, size, overlay_timestamp=False, label_params=None, workers=None,
+                        shifts=None):
+    # Decode in a thread pool (imread releases the GIL) while keeping output order.
+    # At most 2 * workers frames are in flight, so memory stays bounded.
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for i, filename in enumerate(filenames):
+            label = get_label_from_filename(filename) if overlay_timestamp else None
+            shift = tuple(shifts[i]) if shifts is not None else None
+            future = pool.submit(decode_frame, input_dir, filename, size, label, label_params, shift)
+            pending.append((filename, future))
+            if len(pending) >= workers * 2:
+                done_name, done_future = pending.popleft()
+                yield done_name, done_future.result()
+        while pending:
+            done_name, done_future = pending.popleft()
+            yield done_name, done_future.result()
+
+def create_timelapse(input_dir, output_file, fps=24, overlay_timestamp=False, workers=None,
+                     stabilize=None, smooth_radius=5, merge=None, merge_window=5, filters=None):
+    # overlay_timestamp: draw the capture time (parsed from each filename) onto
+    # the frames while rendering, so raw captures can be kept as the only archive
+    # stabilize: None, 'reference' (lock to the first frame) or 'rolling'
+    # (follow the smoothed camera path); smooth_radius is in frames, rolling only
+    # merge: None, 'mean', 'max' or 'decay' over the last merge_window frames
+    # filters: conditions on the capture-time stats sidecar, e.g. "luma > 40, sharpness > 100";
+    # rejected frames are dropped before any decoding
+    # Returns True when the video was written, False otherwise
     try:
         # Get all image files
-        image_files = [f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        image_files = list_frames(input_dir)
         
         if not image_files:
             print("No image files found in the input directory!")
-            return
+            return False
         
         # Sort files by timestamp and index
-        sorted_files = []
-        for filename in image_files:
-            timestamp, index = get_timestamp_from_filename(filename)
-            if timestamp:
-                sorted_files.append((timestamp, index, filename))
-        
-        if not sorted_files:
-            # 如果没有任何符合timestamp格式的图片，则按文件名升序排序
-            print("未找到符合时间戳格式的图片，按文件名排序处理。")
-            image_files.sort()  # 文件名升序
+        if all(HIGH_RATE_NAME_PATTERN.match(f) for f in image_files):
+            # 高速模式文件名定宽，直接按文件名排序，无需逐个解析
+            image_files.sort()
             sorted_files = [(None, 0, filename) for filename in image_files]
         else:
-            sorted_files.sort(key=lambda x: (x[0], x[1]))
+            sorted_files = []
+            for filename in image_files:
+                timestamp, index = get_timestamp_from_filename(filename)
+                if timestamp:
+                    sorted_files.append((timestamp, index, filename))
+            
+            if not sorted_files:
+                # 如果没有任何符合timestamp格式的图片，则按文件名升序排序
+                print("未找到符合时间戳格式的图片，按文件名排序处理。")
+                image_files.sort()  # 文件名升序
+                sorted_files = [(None, 0, filename) for filename in image_files]
+            else:
+                sorted_files.sort(key=lambda x: (x[0], x[1]))
+        
+        if filters:
+            kept = set(filter_by_stats(input_dir, [filename for _, _, filename in sorted_files], filters))
+            sorted_files = [item for item in sorted_files if item[2] in kept]
         
         if not sorted_files:
             print("No valid image files found!")
-            return
+            return False
         
         # Get the first image to determine video dimensions
         first_image_path = os.path.join(input_dir, sorted_files[0][2])
-        first_image = cv2.imread(first_image_path)
+        first_image = read_image(input_dir, sorted_files[0][2])
         if first_image is None:
             print(f"Failed to read the first image: {first_image_path}")
-            return
+            return False
         
         height, width, _ = first_image.shape
         
@@ -56,15 +303,39 @@ def create_timelapse(input_dir, output_file, fps=24):
         
         if not out.isOpened():
             print(f"Failed to create video writer for {output_file}")
-            return
+            return False
+        
+        # 时间戳位置和字号只与输出分辨率有关，计算一次即可
+        label_params = None
+        if overlay_timestamp:
+            sample_label = get_label_from_filename(sorted_files[0][2])
+            if sample_label is None:
+                print("文件名中没有拍摄时间，跳过时间戳叠加。")
+                overlay_timestamp = False
+            else:
+                label_params = calc_timestamp_params(first_image.shape, sample_label)
+        
+        filenames = [filename for _, _, filename in sorted_files]
+        shifts = None
+        if stabilize:
+            print(f"正在估计画面抖动（{stabilize}）...")
+            shifts = compute_stabilization(input_dir, filenames, (width, height), stabilize, smooth_radius, workers)
+        
+        merger = FrameMerger(merge, merge_window) if merge else None
+        # Merged frames blend neighbouring labels, so draw the label after merging
+        worker_overlay = overlay_timestamp and merger is None
         
         # Write frames to video
-        for _, _, filename in sorted_files:
-            img_path = os.path.join(input_dir, filename)
-            frame = cv2.imread(img_path)
+        for filename, frame in iter_decoded_frames(input_dir, filenames, (width, height),
+                                                   worker_overlay, label_params, workers, shifts):
             if frame is None:
-                print(f"Failed to read image: {img_path}")
+                print(f"Failed to read image: {os.path.join(input_dir, filename)}")
                 continue
+            if merger is not None:
+                frame = merger.push(frame)
+                label = get_label_from_filename(filename) if overlay_timestamp else None
+                if label is not None:
+                    frame = add_timestamp_to_image(frame, label, label_params)
             out.write(frame)
             print(f"Processed: {filename}")
         
@@ -91,11 +362,14 @@ def create_timelapse(input_dir, output_file, fps=24):
             print(f"H.264 视频已保存为: {h264_output}")
         except Exception as e:
             print(f"ffmpeg 转码失败: {e}")
+        # H.264 转码只是附加步骤，mp4v 视频已经生成即视为成功
+        return True
         
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         if 'out' in locals():
             out.release()
+        return False
 
 if __name__ == "__main__":
     # Get input directory from user
@@ -121,4 +395,9 @@ if __name__ == "__main__":
         except ValueError:
             print("请输入有效的数字！")
     
-    create_timelapse(input_directory, output_video, fps)
\ No newline at end of file
+    overlay = input("是否在视频中叠加拍摄时间（y/N）: ").strip().lower() == 'y'
+    stabilize = 'rolling' if input("是否进行防抖处理（y/N）: ").strip().lower() == 'y' else None
+    filters = input("按画面统计过滤（如 luma>40, sharpness>100，留空不过滤）: ").strip() or None
+    
+    create_timelapse(input_directory, output_video, fps, overlay_timestamp=overlay, stabilize=stabilize,
+                     filters=filters)
\ No newline at end of file
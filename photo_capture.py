@@ -1,6 +1,14 @@
 import cv2
 import time
 import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from frame_chunks import ChunkWriter, DEFAULT_CHUNK_SIZE
+from timelapse_common import IMAGE_FORMATS, STATS_COLUMNS
+
+# 高速模式下文件名中序号的位数，保证文件名按字典序排列即为拍摄顺序
+HIGH_RATE_INDEX_DIGITS = 8
 
 def get_supported_resolutions(cap, log_func=print):
     """
@@ -35,6 +43,282 @@ def get_supported_resolutions(cap, log_func=print):
             log_func(f"支持的分辨率: {width}x{height}")
     return resolutions
 
+class MonotonicClock:
+    """
+    以单调时钟为基准的墙上时间。
+    启动时记录一次系统时间作为锚点，之后只根据time.monotonic()推进，
+    系统校时不会导致时间戳回退或跳变，保证高速拍摄时文件名单调递增。
+    """
+    def __init__(self):
+        self._wall_anchor = time.time()
+        self._mono_anchor = time.monotonic()
+
+    def now(self):
+        """返回当前时间（秒，浮点数，与time.time()同一基准）。"""
+        return self._wall_anchor + (time.monotonic() - self._mono_anchor)
+
+def format_timestamp_ms(t):
+    """
+    将时间格式化为毫秒精度的时间戳字符串。
+    参数：
+        t: time.time()形式的时间（秒）
+    返回：
+        如 '2025-07-04_23:38:59.123'
+    """
+    ms = int(t * 1000) % 1000
+    return time.strftime("%Y-%m-%d_%H:%M:%S", time.localtime(t)) + f".{ms:03d}"
+
+def make_high_rate_filename(t, index, ext='.jpg'):
+    """
+    生成高速模式的文件名，所有字段定宽，按字典序排序即为拍摄顺序。
+    文件名中为UTC时间（以Z结尾），夏令时结束、本地时间回拨时顺序也不会错乱；
+    画面上的时间戳仍为本地时间，生成视频时也会换算回本地时间。
+    参数：
+        t: time.time()形式的拍摄时间（秒）
+        index: 帧序号
+        ext: 文件扩展名
+    返回：
+        如 'photo_2025-07-04_15-38-59-123Z_00000168.jpg'
+    """
+    ms = int(t * 1000) % 1000
+    stamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.gmtime(t))
+    return f"photo_{stamp}-{ms:03d}Z_{index:0{HIGH_RATE_INDEX_DIGITS}d}{ext}"
+
+def configure_high_rate_camera(cap, fps):
+    """
+    为高速拍摄调整摄像头参数：
+    使用MJPG格式（USB摄像头在YUYV下1080p通常只有5帧左右），
+    请求目标帧率，并把缓冲区压到1帧以减少读取到旧画面的延迟。
+    参数：
+        cap: cv2.VideoCapture对象
+        fps: 目标帧率
+    """
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_FPS, fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+# 保存格式（IMAGE_FORMATS中的名称）对应的扩展名和imwrite质量参数
+IMAGE_ENCODERS = {
+    'jpg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+
+def clip_roi(roi, image_shape):
+    """
+    把裁剪区域限制在画面范围内。
+    参数：
+        roi: 裁剪区域(x, y, 宽, 高)
+        image_shape: 图像的shape (高, 宽, 通道)
+    返回：
+        截取到画面内的(x, y, 宽, 高)；与画面没有交集或宽高为0时返回None
+    """
+    h, w = image_shape[:2]
+    x, y, rw, rh = roi
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(w, x + rw), min(h, y + rh)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return (x0, y0, x1 - x0, y1 - y0)
+
+def prepare_frame(frame, roi=None, output_size=None):
+    """
+    裁剪并缩放画面。裁剪只是NumPy切片（不复制数据），缩放只做一次。
+    参数：
+        frame: 原始图像
+        roi: 裁剪区域(x, y, 宽, 高)，应先用clip_roi限制在画面内，None为不裁剪
+        output_size: 输出尺寸(宽, 高)，None为保持裁剪后的尺寸
+    返回：
+        处理后的图像
+    """
+    if roi is not None:
+        x, y, w, h = roi
+        frame = frame[y:y + h, x:x + w]
+    if output_size is not None and (frame.shape[1], frame.shape[0]) != tuple(output_size):
+        frame = cv2.resize(frame, tuple(output_size), interpolation=cv2.INTER_AREA)
+    return frame
+
+def save_frame(filename, frame, write_params, chunk_writer=None):
+    """
+    按文件扩展名编码并写入图片。
+    参数：
+        filename: 保存路径
+        frame: 图像
+        write_params: imencode参数，如[cv2.IMWRITE_JPEG_QUALITY, 95]
+        chunk_writer: ChunkWriter对象，不为None时追加到分块存储而不是单独写文件
+    返回：
+        写入的字节数，失败时为0
+    """
+    ok, buf = cv2.imencode(os.path.splitext(filename)[1], frame, write_params)
+    if not ok:
+        return 0
+    # 磁盘已满、没有权限等写入错误只跳过这一帧，与cv2.imwrite返回False时一致
+    try:
+        if chunk_writer is not None:
+            chunk_writer.append(os.path.basename(filename), buf)
+        else:
+            with open(filename, 'wb') as f:
+                f.write(buf)
+    except OSError:
+        return 0
+    return len(buf)
+
+class FrameWriter:
+    """
+    后台写图线程池。cv2.imencode在编码时会释放GIL，
+    放到后台线程后拍摄循环只负责读帧，不会被JPEG编码拖慢。
+    同时在途的帧数有上限，磁盘跟不上时拍摄循环会阻塞等待，内存不会无限增长。
+    """
+    def __init__(self, max_workers=2, max_pending=8, chunk_writer=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._chunk_writer = chunk_writer
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self.failed = 0
+        self.bytes_written = 0
+
+    def submit(self, filename, frame, write_params):
+        self._slots.acquire()
+        future = self._pool.submit(save_frame, filename, frame, write_params, self._chunk_writer)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        with self._lock:
+            if future.exception() is not None or not future.result():
+                self.failed += 1
+            else:
+                self.bytes_written += future.result()
+        self._slots.release()
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+# 画面统计文件：output_dir下的目录，每列一个文件，逐帧追加。
+# 生成视频时只读这几个小文件即可按亮度、清晰度筛选，无需解码图片。
+STATS_DIR = "frame_stats"
+STATS_WIDTH = 320
+HIST_BINS = 8
+# 标量列见timelapse_common.STATS_COLUMNS，均为float32
+
+def compute_frame_stats(frame):
+    """
+    在缩小的副本上计算画面统计。
+    参数：
+        frame: BGR图像
+    返回：
+        字典：luma（平均亮度）、sharpness（拉普拉斯方差）、mean_b/g/r（各通道均值）、
+        hist（各通道HIST_BINS档归一化直方图，uint8，总和约255）
+    """
+    h, w = frame.shape[:2]
+    if w > STATS_WIDTH:
+        # 固定宽度缩小，不同分辨率下的清晰度数值可以互相比较
+        small = cv2.resize(frame, (STATS_WIDTH, max(1, h * STATS_WIDTH // w)), interpolation=cv2.INTER_AREA)
+    else:
+        small = frame
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(gray, cv2.CV_32F))
+    mean_b, mean_g, mean_r, _ = cv2.mean(small)
+    pixels = small.shape[0] * small.shape[1]
+    hist = []
+    for ch in range(3):
+        counts = cv2.calcHist([small], [ch], None, [HIST_BINS], [0, 256])
+        hist.extend(int(round(c * 255 / pixels)) for c in counts.ravel())
+    return {
+        'luma': cv2.mean(gray)[0],
+        'sharpness': float(stddev[0][0]) ** 2,
+        'mean_b': mean_b,
+        'mean_g': mean_g,
+        'mean_r': mean_r,
+        'hist': hist,
+    }
+
+class FrameStatsWriter:
+    """
+    逐帧追加画面统计。文件：
+        name.txt: 每行一个照片文件名
+        <列名>.f32: STATS_COLUMNS中每列一个文件，float32小端
+        hist.u8: 每帧3*HIST_BINS个字节
+    程序中断时各列长度可能不一致，打开时先把所有文件截断到共同的行数，
+    否则之后追加的行会与文件名错位；读取时同样按最短列截断。
+    """
+    def __init__(self, output_dir, flush_every=32):
+        self.stats_dir = os.path.join(output_dir, STATS_DIR)
+        os.makedirs(self.stats_dir, exist_ok=True)
+        self._truncate_to_common_rows()
+        self._names = open(os.path.join(self.stats_dir, 'name.txt'), 'a', encoding='utf-8')
+        self._columns = {col: open(os.path.join(self.stats_dir, f'{col}.f32'), 'ab') for col in STATS_COLUMNS}
+        self._hist = open(os.path.join(self.stats_dir, 'hist.u8'), 'ab')
+        self._flush_every = flush_every
+        self._pending = 0
+
+    def _truncate_to_common_rows(self):
+        names_path = os.path.join(self.stats_dir, 'name.txt')
+        names = b''
+        if os.path.exists(names_path):
+            with open(names_path, 'rb') as f:
+                names = f.read()
+        # 只计完整的行，末尾没有换行的半行不算
+        lines = names.split(b'\n')[:-1]
+        sizes = {f'{col}.f32': 4 for col in STATS_COLUMNS}
+        sizes['hist.u8'] = 3 * HIST_BINS
+        paths = {file: os.path.join(self.stats_dir, file) for file in sizes}
+        n = len(lines)
+        for file, size in sizes.items():
+            n = min(n, os.path.getsize(paths[file]) // size if os.path.exists(paths[file]) else 0)
+        for file, size in sizes.items():
+            if os.path.exists(paths[file]) and os.path.getsize(paths[file]) != n * size:
+                os.truncate(paths[file], n * size)
+        names_size = sum(len(line) + 1 for line in lines[:n])
+        if len(names) != names_size:
+            os.truncate(names_path, names_size)
+
+    def append(self, name, stats):
+        for col, f in self._columns.items():
+            f.write(struct.pack('<f', stats[col]))
+        self._hist.write(bytes(stats['hist']))
+        # 文件名最后写入，保证有文件名的行其余各列一定完整
+        self._names.write(name + '\n')
+        self._pending += 1
+        if self._pending >= self._flush_every:
+            self.flush()
+
+    def flush(self):
+        for f in self._columns.values():
+            f.flush()
+        self._hist.flush()
+        self._names.flush()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        for f in self._columns.values():
+            f.close()
+        self._hist.close()
+        self._names.close()
+
+def read_frame_stats(output_dir):
+    """
+    读取画面统计。
+    参数：
+        output_dir: 照片目录
+    返回：
+        (文件名列表, 列字典)，列为numpy数组，hist形状为(N, 3*HIST_BINS)；没有统计文件时返回(None, None)
+    """
+    import numpy as np
+    stats_dir = os.path.join(output_dir, STATS_DIR)
+    names_path = os.path.join(stats_dir, 'name.txt')
+    if not os.path.exists(names_path):
+        return None, None
+    with open(names_path, encoding='utf-8') as f:
+        names = f.read().splitlines()
+    columns = {col: np.fromfile(os.path.join(stats_dir, f'{col}.f32'), dtype='<f4') for col in STATS_COLUMNS}
+    columns['hist'] = np.fromfile(os.path.join(stats_dir, 'hist.u8'), dtype=np.uint8)
+    n = min([len(names), len(columns['hist']) // (3 * HIST_BINS)] + [len(columns[col]) for col in STATS_COLUMNS])
+    names = names[:n]
+    for col in STATS_COLUMNS:
+        columns[col] = columns[col][:n]
+    columns['hist'] = columns['hist'][:n * 3 * HIST_BINS].reshape(n, 3 * HIST_BINS)
+    return names, columns
+
 def calc_timestamp_params(image_shape, timestamp):
     """
     计算时间戳绘制所需的字体、位置、底框等参数。
@@ -89,90 +373,253 @@ def add_timestamp_to_image(image, timestamp, params):
     cv2.putText(image, timestamp, (x, y), font, font_scale, (255,255,255), thickness, cv2.LINE_AA)
     return image
 
-def capture_timelapse(a, b, log_func=print):
+def capture_timelapse(a, b, log_func=print, output_dir=None, resolution=None,
+                      add_timestamp=True, high_rate=False, stop_event=None, progress_func=None,
+                      save_stats=False, roi=None, output_size=None, image_format='jpg', quality=95,
+                      storage='files', chunk_size=DEFAULT_CHUNK_SIZE, cap=None):
     """
     执行延时拍摄，保存带时间戳的图片。
     参数：
         a: 拍摄间隔（秒）
         b: 拍摄次数
         log_func: 日志输出函数，默认为print
+        output_dir: 照片保存目录，None为默认目录
+        resolution: 分辨率(宽, 高)，None为自动检测并选择最接近默认值的分辨率
+        add_timestamp: 是否在图片上添加时间戳
+        high_rate: 高速模式，毫秒时间戳、定宽文件名、后台写图，适合1秒以内的间隔
+        stop_event: threading.Event，置位后停止拍摄
+        progress_func: 进度回调，参数为已拍摄张数
+        save_stats: 是否记录每帧的画面统计（亮度、直方图、清晰度）到output_dir下的统计文件
+        roi: 裁剪区域(x, y, 宽, 高)，None为整幅画面
+        output_size: 保存尺寸(宽, 高)，None为不缩放
+        image_format: 保存格式，'jpg'或'webp'
+        quality: 编码质量（1-100）
+        storage: 'files'每帧一个文件；'chunks'追加到output_dir下的大数据块，见frame_chunks
+        chunk_size: 分块存储时每个数据块的大小（字节）
+        cap: 已打开的cv2.VideoCapture，None时自行打开并在结束后释放；传入时resolution不为None则设置到该摄像头
+    返回：
+        拍摄统计字典（帧数、耗时、实际帧率、目标帧率、写入字节数），初始化失败时返回None
     """
-    output_dir = r"D:\timerPhotosOutpuut"
+    if image_format not in IMAGE_FORMATS:
+        log_func(f"不支持的保存格式: {image_format}")
+        return None
+    ext, quality_flag = IMAGE_ENCODERS[image_format]
+    write_params = [quality_flag, int(quality)]
+    if output_dir is None:
+        output_dir = r"D:\timerPhotosOutpuut"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     max_retries = 3
     retry_delay = 2  # seconds
-    cap = None
-    for retry in range(max_retries):
-        log_func(f"尝试初始化摄像头 (尝试 {retry + 1}/{max_retries})...")
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            log_func("无法打开摄像头")
-            cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            if retry < max_retries - 1:
-                log_func(f"等待 {retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
-                continue
-            else:
-                log_func("达到最大重试次数，程序退出")
-                return
-        supported_resolutions = get_supported_resolutions(cap, log_func=log_func)
-        if not supported_resolutions:
-            log_func("未检测到可用分辨率，程序退出")
-            cap.release()
-            return
-        target_resolution = (1280, 720)
-        best_resolution = min(supported_resolutions, 
-                            key=lambda x: abs(x[0] - target_resolution[0]) + abs(x[1] - target_resolution[1]))
-        log_func(f"\n选择的分辨率: {best_resolution[0]}x{best_resolution[1]}")
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, best_resolution[0])
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, best_resolution[1])
-        width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-        height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        log_func(f"当前摄像头分辨率: {width}x{height}")
+    own_cap = cap is None
+    if not own_cap:
+        # 使用调用方已打开的摄像头（如守护进程中保持打开的摄像头），结束后不释放
+        if high_rate:
+            configure_high_rate_camera(cap, 1.0 / a)
+        if resolution is not None and (cap.get(cv2.CAP_PROP_FRAME_WIDTH), cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) != tuple(resolution):
+            # 只在分辨率不同时设置，重新协商分辨率会让摄像头短暂停顿
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+            log_func(f"当前摄像头分辨率: {cap.get(cv2.CAP_PROP_FRAME_WIDTH)}x{cap.get(cv2.CAP_PROP_FRAME_HEIGHT)}")
         ret, frame = cap.read()
         if not ret:
-            log_func("摄像头初始化成功，但无法读取画面")
-            cap.release()
-            if retry < max_retries - 1:
-                log_func(f"等待 {retry_delay} 秒后重试...")
-                time.sleep(retry_delay)
-                continue
-            else:
-                log_func("达到最大重试次数，程序退出")
-                return
-        log_func("摄像头初始化成功！")
-        break
+            log_func("无法从摄像头读取画面")
+            return None
     else:
-        log_func("摄像头初始化失败，程序退出")
-        return
-    # 计算一次时间戳参数
-    sample_timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
+        for retry in range(max_retries):
+            if stop_event is not None and stop_event.is_set():
+                log_func("已停止拍摄")
+                return None
+            log_func(f"尝试初始化摄像头 (尝试 {retry + 1}/{max_retries})...")
+            cap = cv2.VideoCapture(0)
+            if not cap.isOpened():
+                log_func("无法打开摄像头")
+                cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+                if retry < max_retries - 1:
+                    log_func(f"等待 {retry_delay} 秒后重试...")
+                    time.sleep(retry_delay)
+                    continue
+                else:
+                    log_func("达到最大重试次数，程序退出")
+                    return None
+            if high_rate:
+                configure_high_rate_camera(cap, 1.0 / a)
+            if resolution is not None:
+                # 指定了分辨率（如GUI中已检测并选择），直接设置
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+            else:
+                supported_resolutions = get_supported_resolutions(cap, log_func=log_func)
+                if not supported_resolutions:
+                    log_func("未检测到可用分辨率，程序退出")
+                    cap.release()
+                    return None
+                target_resolution = (1920, 1080) if high_rate else (1280, 720)
+                best_resolution = min(supported_resolutions, 
+                                    key=lambda x: abs(x[0] - target_resolution[0]) + abs(x[1] - target_resolution[1]))
+                log_func(f"\n选择的分辨率: {best_resolution[0]}x{best_resolution[1]}")
+                cap.set(cv2.CAP_PROP_FRAME_WIDTH, best_resolution[0])
+                cap.set(cv2.CAP_PROP_FRAME_HEIGHT, best_resolution[1])
+            width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+            log_func(f"当前摄像头分辨率: {width}x{height}")
+            ret, frame = cap.read()
+            if not ret:
+                log_func("摄像头初始化成功，但无法读取画面")
+                cap.release()
+                if retry < max_retries - 1:
+                    log_func(f"等待 {retry_delay} 秒后重试...")
+                    time.sleep(retry_delay)
+                    continue
+                else:
+                    log_func("达到最大重试次数，程序退出")
+                    return None
+            log_func("摄像头初始化成功！")
+            break
+        else:
+            log_func("摄像头初始化失败，程序退出")
+            return None
+    if roi is not None:
+        clipped = clip_roi(roi, frame.shape)
+        if clipped is None:
+            log_func(f"裁剪区域 {roi} 不在画面 {frame.shape[1]}x{frame.shape[0]} 内，程序退出")
+            if own_cap:
+                cap.release()
+            return None
+        if clipped != tuple(roi):
+            log_func(f"裁剪区域超出画面，已调整为 {clipped}")
+        roi = clipped
+    if output_size is not None and min(output_size) <= 0:
+        log_func(f"保存尺寸无效: {output_size}")
+        if own_cap:
+            cap.release()
+        return None
+    clock = MonotonicClock()
+    frame = prepare_frame(frame, roi, output_size)
+    if roi is not None or output_size is not None:
+        log_func(f"保存尺寸: {frame.shape[1]}x{frame.shape[0]}")
+    # 按裁剪缩放后的尺寸计算一次时间戳参数
+    sample_timestamp = format_timestamp_ms(clock.now()) if high_rate else time.strftime("%Y-%m-%d_%H:%M:%S")
     params = calc_timestamp_params(frame.shape, sample_timestamp)
+    chunk_writer = ChunkWriter(output_dir, chunk_size) if storage == 'chunks' else None
+    writer = FrameWriter(chunk_writer=chunk_writer) if high_rate else None
+    stats_writer = FrameStatsWriter(output_dir) if save_stats else None
+    # 高速模式下每秒只输出一条日志，避免日志本身拖慢拍摄
+    log_every = max(1, int(round(1.0 / a))) if high_rate else 1
+    saved = 0
+    bytes_written = 0
+    start = time.monotonic()
+    next_shot = start
     try:
         for i in range(b):
+            if stop_event is not None and stop_event.is_set():
+                log_func("已停止拍摄")
+                break
             ret, frame = cap.read()
             if not ret:
                 log_func(f"Error: Could not capture frame {i+1}")
                 continue
-            timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-            frame = add_timestamp_to_image(frame, timestamp, params)
-            filename = os.path.join(output_dir, f"photo_{timestamp.replace(':','-')}_{i+1}.jpg")
-            cv2.imwrite(filename, frame)
-            log_func(f"Saved photo {i+1}/{b} to {filename}")
+            if high_rate:
+                now = clock.now()
+                timestamp = format_timestamp_ms(now)
+                filename = os.path.join(output_dir, make_high_rate_filename(now, i + 1, ext))
+            else:
+                timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
+                filename = os.path.join(output_dir, f"photo_{timestamp.replace(':','-')}_{i+1}{ext}")
+            frame = prepare_frame(frame, roi, output_size)
+            if stats_writer is not None:
+                # 在叠加时间戳之前统计，文字不影响亮度和清晰度
+                stats_writer.append(os.path.basename(filename), compute_frame_stats(frame))
+            if add_timestamp:
+                frame = add_timestamp_to_image(frame, timestamp, params)
+            if writer is not None:
+                writer.submit(filename, frame, write_params)
+                saved += 1
+                if (i + 1) % log_every == 0 or i == b - 1:
+                    log_func(f"Saved photo {i+1}/{b} to {filename}")
+            else:
+                size = save_frame(filename, frame, write_params, chunk_writer)
+                if not size:
+                    log_func(f"Error: Could not save frame {i+1} to {filename}")
+                else:
+                    saved += 1
+                    bytes_written += size
+                    log_func(f"Saved photo {i+1}/{b} to {filename} ({size / 1024:.1f} KB)")
+            if progress_func is not None:
+                progress_func(i + 1)
             if i < b - 1:
-                time.sleep(a)
+                if high_rate:
+                    # 按绝对时刻排程，读帧和写图的耗时不会累积成间隔漂移
+                    next_shot += a
+                    delay = next_shot - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_shot = time.monotonic()
+                else:
+                    time.sleep(a)
     finally:
-        cap.release()
+        if stats_writer is not None:
+            stats_writer.close()
+        if writer is not None:
+            writer.close()
+            saved -= writer.failed
+            bytes_written += writer.bytes_written
+            if writer.failed:
+                log_func(f"有 {writer.failed} 张照片写入失败")
+        if chunk_writer is not None:
+            chunk_writer.close()
+        if own_cap:
+            cap.release()
         log_func("Timelapse capture completed!")
+    elapsed = time.monotonic() - start
+    stats = {
+        'frames': saved,
+        'elapsed': elapsed,
+        'fps': saved / elapsed if elapsed > 0 else 0.0,
+        'target_fps': 1.0 / a,
+        'bytes': bytes_written,
+        'bytes_per_frame': bytes_written / saved if saved else 0.0,
+    }
+    if saved:
+        log_func(f"共写入 {bytes_written / 1024 / 1024:.1f} MB，平均每张 {stats['bytes_per_frame'] / 1024:.1f} KB")
+    if high_rate:
+        log_func(f"实际帧率: {stats['fps']:.2f} fps / 目标帧率: {stats['target_fps']:.2f} fps")
+    return stats
+
+def benchmark_capture(target_fps=10, duration=10, resolution=(1920, 1080), log_func=print):
+    """
+    测量高速模式下的持续拍摄帧率。照片写入临时目录，测完即删除。
+    参数：
+        target_fps: 目标帧率
+        duration: 测试时长（秒）
+        resolution: 目标分辨率
+        log_func: 日志输出函数，默认为print
+    返回：
+        capture_timelapse返回的统计字典，附加达成率'ratio'
+    """
+    import tempfile
+    count = max(1, int(target_fps * duration))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        stats = capture_timelapse(1.0 / target_fps, count, log_func=log_func, output_dir=tmp_dir,
+                                  resolution=resolution, high_rate=True)
+    if stats is None:
+        return None
+    stats['ratio'] = stats['fps'] / stats['target_fps']
+    log_func(f"基准测试: {resolution[0]}x{resolution[1]} 持续 {stats['elapsed']:.1f} 秒，"
+             f"{stats['frames']} 帧，{stats['fps']:.2f}/{stats['target_fps']:.2f} fps "
+             f"（达成率 {stats['ratio'] * 100:.0f}%）")
+    return stats
 
 if __name__ == "__main__":
     try:
         a = float(input("请输入拍摄间隔时间（秒）："))
         b = int(input("请输入拍摄次数："))
+        # 不在照片上叠加时间戳时，可在生成视频时再根据文件名中的拍摄时间叠加
+        add_timestamp = input("是否在照片上添加时间戳（Y/n）：").strip().lower() != 'n'
         if a <= 0 or b <= 0:
             print("请输入大于0的整数！")
         else:
-            capture_timelapse(a, b)
+            capture_timelapse(a, b, add_timestamp=add_timestamp, high_rate=a < 1)
     except ValueError:
         print("请输入有效的整数！")
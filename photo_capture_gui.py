@@ -2,17 +2,15 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox, filedialog
 import threading
-import time
 import os
-import cv2
-from photo_capture import capture_timelapse, get_supported_resolutions
-from photo2video import create_timelapse  # 新增导入
+from timelapse_common import IMAGE_FORMATS, parse_filters
+# cv2 和拍摄、合成模块在用到时才导入，窗口可以先显示出来
 
 class TimelapseApp:
     def __init__(self, root):
         self.root = root
         self.root.title("延时摄影控制台")
-        self.root.geometry("700x320")
+        self.root.geometry("820x350")
         self.root.resizable(False, False)
 
         # 创建Notebook
@@ -59,6 +57,9 @@ class TimelapseApp:
         self.add_timestamp_var = tk.IntVar(value=1)
         self.check_add_timestamp = ttk.Checkbutton(input_frame, text="添加时间戳", variable=self.add_timestamp_var)
         self.check_add_timestamp.pack(side='left', padx=(10, 0))
+        self.save_stats_var = tk.IntVar(value=0)
+        self.check_save_stats = ttk.Checkbutton(input_frame, text="记录画面统计", variable=self.save_stats_var)
+        self.check_save_stats.pack(side='left', padx=(10, 0))
         # 分辨率和保存路径区
         action_frame = ttk.Frame(parent)
         action_frame.pack(pady=(10, 0), padx=10, fill='x')
@@ -79,6 +80,29 @@ class TimelapseApp:
         self.entry_save_path.config(state='readonly')
         self.btn_choose_path = ttk.Button(action_frame, text="选择", command=self.choose_save_path)
         self.btn_choose_path.pack(side='left', padx=(5, 0))
+        # 裁剪、保存尺寸和格式
+        output_frame = ttk.Frame(parent)
+        output_frame.pack(pady=(10, 0), padx=10, fill='x')
+        ttk.Label(output_frame, text="裁剪区域(x,y,宽,高)：").pack(side='left')
+        self.entry_roi = ttk.Entry(output_frame, width=18)
+        self.entry_roi.pack(side='left', padx=(5, 20))
+        ttk.Label(output_frame, text="保存尺寸：").pack(side='left')
+        self.combo_output_size = ttk.Combobox(output_frame, width=10)
+        self.combo_output_size['values'] = ['原始', '1920x1080', '1280x720', '640x480']
+        self.combo_output_size.set('原始')
+        self.combo_output_size.pack(side='left', padx=(5, 20))
+        ttk.Label(output_frame, text="格式：").pack(side='left')
+        self.combo_image_format = ttk.Combobox(output_frame, state='readonly', width=5)
+        self.combo_image_format['values'] = list(IMAGE_FORMATS)
+        self.combo_image_format.set('jpg')
+        self.combo_image_format.pack(side='left', padx=(5, 20))
+        ttk.Label(output_frame, text="质量：").pack(side='left')
+        self.entry_quality = ttk.Entry(output_frame, width=5)
+        self.entry_quality.insert(0, '95')
+        self.entry_quality.pack(side='left', padx=(5, 0))
+        # 长时间拍摄时追加到大数据块，避免目录中产生大量小文件
+        self.chunk_storage_var = tk.IntVar(value=0)
+        ttk.Checkbutton(output_frame, text="分块存储", variable=self.chunk_storage_var).pack(side='left', padx=(10, 0))
         # 开始拍摄按钮单独一行
         btn_frame = ttk.Frame(parent)
         btn_frame.pack(pady=(8, 0), padx=10, fill='x')
@@ -135,6 +159,24 @@ class TimelapseApp:
         self.video_fps = tk.StringVar(value="24")
         self.entry_video_fps = ttk.Entry(frame2, textvariable=self.video_fps, width=5)
         self.entry_video_fps.pack(side='left', padx=(5, 0))
+        # 渲染时根据文件名中的拍摄时间叠加时间戳，拍摄时可保存无时间戳原图
+        self.video_overlay_var = tk.IntVar(value=0)
+        ttk.Checkbutton(frame2, text="渲染时添加时间戳", variable=self.video_overlay_var).pack(side='left', padx=(20, 0))
+        self.video_stabilize_var = tk.IntVar(value=0)
+        ttk.Checkbutton(frame2, text="防抖", variable=self.video_stabilize_var).pack(side='left', padx=(10, 0))
+        # 多帧合成：光轨（最大值）、运动模糊（平均/衰减）
+        ttk.Label(frame2, text="多帧合成：").pack(side='left', padx=(10, 0))
+        self.combo_video_merge = ttk.Combobox(frame2, state='readonly', width=5)
+        self.combo_video_merge['values'] = ['无', '平均', '光轨', '衰减']
+        self.combo_video_merge.set('无')
+        self.combo_video_merge.pack(side='left', padx=(5, 0))
+        ttk.Label(frame2, text="帧数：").pack(side='left', padx=(10, 0))
+        self.video_merge_window = tk.StringVar(value="5")
+        ttk.Entry(frame2, textvariable=self.video_merge_window, width=4).pack(side='left', padx=(5, 0))
+        # 按拍摄时记录的画面统计过滤，如 luma>40, sharpness>100
+        ttk.Label(frame2, text="过滤：").pack(side='left', padx=(10, 0))
+        self.video_filters = tk.StringVar(value="")
+        ttk.Entry(frame2, textvariable=self.video_filters, width=20).pack(side='left', padx=(5, 0))
         # 开始按钮
         btn_video_frame = ttk.Frame(parent)
         btn_video_frame.pack(pady=(8, 0), padx=10, fill='x')
@@ -195,11 +237,29 @@ class TimelapseApp:
         if not output_dir:
             output_dir = os.path.join(os.getcwd(), "VideoOutput")
         output_file = os.path.join(output_dir, f"{output_name}.mp4")
+        overlay_timestamp = self.video_overlay_var.get() == 1
+        stabilize = 'rolling' if self.video_stabilize_var.get() == 1 else None
+        merge = {'平均': 'mean', '光轨': 'max', '衰减': 'decay'}.get(self.combo_video_merge.get())
+        try:
+            merge_window = int(self.video_merge_window.get().strip())
+            if merge_window <= 0:
+                raise ValueError
+        except ValueError:
+            self.append_video_status("合成帧数必须为正整数！\n")
+            return
+        filters = self.video_filters.get().strip() or None
+        if filters:
+            try:
+                parse_filters(filters)
+            except ValueError as e:
+                self.append_video_status(f"过滤条件无效: {e}\n")
+                return
         self.btn_video_start.config(state='disabled')
         self.append_video_status(f"开始生成视频: {output_file}\n")
-        threading.Thread(target=self.run_create_timelapse, args=(input_dir, output_file, fps, output_dir), daemon=True).start()
+        threading.Thread(target=self.run_create_timelapse, args=(input_dir, output_file, fps, output_dir, overlay_timestamp, stabilize, merge, merge_window, filters), daemon=True).start()
 
-    def run_create_timelapse(self, input_dir, output_file, fps, output_dir=None):
+    def run_create_timelapse(self, input_dir, output_file, fps, output_dir=None, overlay_timestamp=False, stabilize=None,
+                             merge=None, merge_window=5, filters=None):
         try:
             if output_dir and not os.path.exists(output_dir):
                 os.makedirs(output_dir)
@@ -210,7 +270,9 @@ class TimelapseApp:
             from io import StringIO
             old_stdout = sys.stdout
             sys.stdout = mystdout = StringIO()
-            create_timelapse(input_dir, output_file, fps)
+            from photo2video import create_timelapse
+            create_timelapse(input_dir, output_file, fps, overlay_timestamp=overlay_timestamp, stabilize=stabilize,
+                             merge=merge, merge_window=merge_window, filters=filters)
             sys.stdout = old_stdout
             log(mystdout.getvalue())
         except Exception as e:
@@ -236,6 +298,7 @@ class TimelapseApp:
         duration = self.entry_duration.get()
         duration_unit = self.combo_duration_unit.get()
         add_timestamp = self.add_timestamp_var.get() == 1
+        save_stats = self.save_stats_var.get() == 1
         try:
             interval = float(interval)
             duration = float(duration)
@@ -244,6 +307,28 @@ class TimelapseApp:
         except ValueError:
             messagebox.showerror("输入错误", "请输入大于0的数字！")
             return
+        try:
+            roi_text = self.entry_roi.get().strip()
+            roi = tuple(int(v) for v in roi_text.split(',')) if roi_text else None
+            if roi is not None and (len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0):
+                raise ValueError
+            size_text = self.combo_output_size.get().strip()
+            output_size = None if size_text in ('', '原始') else tuple(int(v) for v in size_text.lower().split('x'))
+            if output_size is not None and (len(output_size) != 2 or min(output_size) <= 0):
+                raise ValueError
+            quality = int(self.entry_quality.get())
+            if not 1 <= quality <= 100:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("输入错误", "裁剪区域格式为x,y,宽,高；保存尺寸格式为宽x高；质量为1-100的整数！")
+            return
+        output_options = {
+            'roi': roi,
+            'output_size': output_size,
+            'image_format': self.combo_image_format.get(),
+            'quality': quality,
+            'storage': 'chunks' if self.chunk_storage_var.get() == 1 else 'files',
+        }
         # 统一间隔为秒
         if interval_unit == '分钟':
             interval_sec = interval * 60
@@ -271,7 +356,7 @@ class TimelapseApp:
         self.current_total = count
         self.stop_flag.clear()
         self.start_button.config(text='停止拍摄', command=self.stop_capture, state='normal')
-        threading.Thread(target=self.run_capture_timelapse, args=(interval_sec, count, res, add_timestamp), daemon=True).start()
+        threading.Thread(target=self.run_capture_timelapse, args=(interval_sec, count, res, add_timestamp, save_stats, output_options), daemon=True).start()
 
     def stop_capture(self):
         """
@@ -285,6 +370,8 @@ class TimelapseApp:
         """
         检测摄像头支持的分辨率，填充下拉框。
         """
+        import cv2
+        from photo_capture import get_supported_resolutions
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             self.resolutions = []
@@ -311,7 +398,7 @@ class TimelapseApp:
         self.res_checked = True
         self.append_status("分辨率检测完成，请选择分辨率或直接开始拍摄。\n")
 
-    def run_capture_timelapse(self, interval, count, res, add_timestamp):
+    def run_capture_timelapse(self, interval, count, res, add_timestamp, save_stats=False, output_options=None):
         """
         启动延时拍摄，支持分辨率选择。
         参数：
@@ -319,170 +406,20 @@ class TimelapseApp:
             count: 拍摄次数
             res: 用户选择的分辨率，None为自动
             add_timestamp: 是否添加时间戳
+            save_stats: 是否记录画面统计
+            output_options: 裁剪、保存尺寸、格式、质量和存储方式，传给capture_timelapse
         """
         def gui_log(msg):
             self.append_status(msg + '\n')
-        # 包装capture_timelapse，支持分辨率参数和进度条
         def update_progress(i):
             self.progress['value'] = i
             self.root.update_idletasks()
-        stopped = False
-        def patched_capture_timelapse(a, b, log_func=print):
-            output_dir = self.save_dir
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
-            max_retries = 3
-            retry_delay = 2
-            cap = None
-            for retry in range(max_retries):
-                if self.stop_flag.is_set():
-                    log_func("已停止拍摄")
-                    return
-                log_func(f"尝试初始化摄像头 (尝试 {retry + 1}/{max_retries})...")
-                cap = cv2.VideoCapture(0)
-                if not cap.isOpened():
-                    log_func("无法打开摄像头")
-                    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-                    if retry < max_retries - 1:
-                        log_func(f"等待 {retry_delay} 秒后重试...")
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        log_func("达到最大重试次数，程序退出")
-                        return
-                if res is not None:
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, res[0])
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, res[1])
-                width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-                height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-                log_func(f"当前摄像头分辨率: {width}x{height}")
-                ret, frame = cap.read()
-                if not ret:
-                    log_func("摄像头初始化成功，但无法读取画面")
-                    cap.release()
-                    if retry < max_retries - 1:
-                        log_func(f"等待 {retry_delay} 秒后重试...")
-                        time.sleep(retry_delay)
-                        continue
-                    else:
-                        log_func("达到最大重试次数，程序退出")
-                        return
-                log_func("摄像头初始化成功！")
-                break
-            else:
-                log_func("摄像头初始化失败，程序退出")
-                return
-            from photo_capture import calc_timestamp_params, add_timestamp_to_image
-            sample_timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-            params = calc_timestamp_params(frame.shape, sample_timestamp)
-            try:
-                for i in range(b):
-                    if self.stop_flag.is_set():
-                        log_func("已停止拍摄")
-                        break
-                    ret, frame = cap.read()
-                    if not ret:
-                        log_func(f"Error: Could not capture frame {i+1}")
-                        continue
-                    timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-                    if add_timestamp:
-                        frame_to_save = add_timestamp_to_image(frame, timestamp, params)
-                    else:
-                        frame_to_save = frame
-                    filename = os.path.join(output_dir, f"photo_{timestamp.replace(':','-')}_{i+1}.jpg")
-                    cv2.imwrite(filename, frame_to_save)
-                    log_func(f"Saved photo {i+1}/{b} to {filename}")
-                    update_progress(i+1)
-                    if i < b - 1:
-                        time.sleep(a)
-            finally:
-                cap.release()
-                log_func("Timelapse capture completed!")
-        # 选择分辨率逻辑
-        if res is not None:
-            patched_capture_timelapse(interval, count, log_func=gui_log)
-        else:
-            # 自动分辨率，需在外部加进度条
-            def gui_capture_timelapse(a, b, log_func=print):
-                output_dir = self.save_dir
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
-                max_retries = 3
-                retry_delay = 2
-                cap = None
-                for retry in range(max_retries):
-                    if self.stop_flag.is_set():
-                        log_func("已停止拍摄")
-                        return
-                    log_func(f"尝试初始化摄像头 (尝试 {retry + 1}/{max_retries})...")
-                    cap = cv2.VideoCapture(0)
-                    if not cap.isOpened():
-                        log_func("无法打开摄像头")
-                        cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-                        if retry < max_retries - 1:
-                            log_func(f"等待 {retry_delay} 秒后重试...")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            log_func("达到最大重试次数，程序退出")
-                            return
-                    from photo_capture import get_supported_resolutions
-                    supported_resolutions = get_supported_resolutions(cap, log_func=log_func)
-                    if not supported_resolutions:
-                        log_func("未检测到可用分辨率，程序退出")
-                        cap.release()
-                        return
-                    target_resolution = (1280, 720)
-                    best_resolution = min(supported_resolutions, key=lambda x: abs(x[0] - target_resolution[0]) + abs(x[1] - target_resolution[1]))
-                    log_func(f"\n选择的分辨率: {best_resolution[0]}x{best_resolution[1]}")
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, best_resolution[0])
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, best_resolution[1])
-                    width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-                    height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
-                    log_func(f"当前摄像头分辨率: {width}x{height}")
-                    ret, frame = cap.read()
-                    if not ret:
-                        log_func("摄像头初始化成功，但无法读取画面")
-                        cap.release()
-                        if retry < max_retries - 1:
-                            log_func(f"等待 {retry_delay} 秒后重试...")
-                            time.sleep(retry_delay)
-                            continue
-                        else:
-                            log_func("达到最大重试次数，程序退出")
-                            return
-                    log_func("摄像头初始化成功！")
-                    break
-                else:
-                    log_func("摄像头初始化失败，程序退出")
-                    return
-                from photo_capture import calc_timestamp_params, add_timestamp_to_image
-                sample_timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-                params = calc_timestamp_params(frame.shape, sample_timestamp)
-                try:
-                    for i in range(b):
-                        if self.stop_flag.is_set():
-                            log_func("已停止拍摄")
-                            break
-                        ret, frame = cap.read()
-                        if not ret:
-                            log_func(f"Error: Could not capture frame {i+1}")
-                            continue
-                        timestamp = time.strftime("%Y-%m-%d_%H:%M:%S")
-                        if add_timestamp:
-                            frame_to_save = add_timestamp_to_image(frame, timestamp, params)
-                        else:
-                            frame_to_save = frame
-                        filename = os.path.join(output_dir, f"photo_{timestamp.replace(':','-')}_{i+1}.jpg")
-                        cv2.imwrite(filename, frame_to_save)
-                        log_func(f"Saved photo {i+1}/{b} to {filename}")
-                        update_progress(i+1)
-                        if i < b - 1:
-                            time.sleep(a)
-                finally:
-                    cap.release()
-                    log_func("Timelapse capture completed!")
-            gui_capture_timelapse(interval, count, log_func=gui_log)
+        # 1秒以内的间隔使用高速模式：毫秒时间戳、定宽文件名、后台写图
+        from photo_capture import capture_timelapse
+        capture_timelapse(interval, count, log_func=gui_log, output_dir=self.save_dir,
+                          resolution=res, add_timestamp=add_timestamp, high_rate=interval < 1,
+                          stop_event=self.stop_flag, progress_func=update_progress,
+                          save_stats=save_stats, **(output_options or {}))
         # 拍摄结束后恢复按钮
         self.start_button.config(text='开始拍摄', command=self.start_capture, state='normal')
         self.stop_flag.clear()
@@ -0,0 +1,78 @@
+import hashlib
+import io
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_ffmpeg
+
+EXE = b'MZ' + bytes(range(256)) * 400
+
+def make_zip():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as z:
+        z.writestr('ffmpeg-7.0-essentials_build/README.txt', 'readme')
+        z.writestr('ffmpeg-7.0-essentials_build/bin/ffmpeg.exe', EXE)
+    return buf.getvalue()
+
+@pytest.fixture
+def server():
+    # 本地替身：支持 Range，第一次下载压缩包时只发一半就断开
+    data = make_zip()
+    files = {'/ffmpeg.zip': data, '/ffmpeg.zip.sha256': hashlib.sha256(data).hexdigest().encode() + b'  ffmpeg.zip'}
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requests.append(self.path)
+            body = files.get(self.path)
+            if body is None:
+                self.send_error(404)
+                return
+            start = 0
+            header = self.headers.get('Range')
+            if header:
+                start = int(header.split('=')[1].split('-')[0])
+                self.send_response(206)
+                self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(body) - start))
+            self.end_headers()
+            if self.path == '/ffmpeg.zip' and not header:
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(body[start:])
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_resume_verify_and_extract(server, tmp_path, monkeypatch):
+    base, requests = server
+    monkeypatch.setattr(download_ffmpeg, 'RETRY_DELAY', 0)
+    # 只改 url，校验值也应从同一个替身服务器获取
+    zip_path = download_ffmpeg.fetch_ffmpeg_zip(base + '/ffmpeg.zip', cache_dir=str(tmp_path / 'cache'))
+    assert zip_path is not None
+    assert requests.count('/ffmpeg.zip') == 2
+    assert '/ffmpeg.zip.sha256' in requests
+    assert download_ffmpeg.extract_ffmpeg_exe(zip_path, str(tmp_path))
+    assert (tmp_path / download_ffmpeg.TARGET_EXE).read_bytes() == EXE
+    assert not (tmp_path / (download_ffmpeg.TARGET_EXE + '.tmp')).exists()
+
+def test_checksum_can_be_disabled(server, tmp_path, monkeypatch):
+    base, requests = server
+    monkeypatch.setattr(download_ffmpeg, 'RETRY_DELAY', 0)
+    zip_path = download_ffmpeg.fetch_ffmpeg_zip(base + '/ffmpeg.zip', cache_dir=str(tmp_path),
+                                                checksum_url=False)
+    assert zip_path is not None
+    assert '/ffmpeg.zip.sha256' not in requests
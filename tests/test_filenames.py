@@ -0,0 +1,13 @@
+from datetime import datetime
+
+from photo_capture import make_high_rate_filename
+from photo2video import HIGH_RATE_NAME_PATTERN, get_timestamp_from_filename
+
+def test_high_rate_names_sort_in_capture_order_and_parse_to_local_time():
+    # 每半小时一帧，跨越 2025-10-26 欧洲夏令时结束；文件名为UTC，与本机时区无关
+    times = [1761438600.0 + k * 1800 + 0.25 for k in range(6)]
+    names = [make_high_rate_filename(t, k) for k, t in enumerate(times)]
+    assert names == sorted(names)
+    assert all(HIGH_RATE_NAME_PATTERN.match(name) for name in names)
+    for t, name in zip(times, names):
+        assert get_timestamp_from_filename(name)[0] == datetime.fromtimestamp(t)
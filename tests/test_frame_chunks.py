@@ -0,0 +1,18 @@
+import os
+
+from frame_chunks import INDEX_NAME, ChunkWriter, open_store
+
+def test_resume_after_half_written_index_line(tmp_path):
+    writer = ChunkWriter(str(tmp_path))
+    writer.append('a.jpg', b'a' * 10)
+    writer.close()
+    # 模拟中断：第二帧的数据已写入，索引只写了半行
+    with open(tmp_path / INDEX_NAME, 'a', encoding='utf-8') as f:
+        f.write('b.jpg\t0\t1')
+    writer = ChunkWriter(str(tmp_path))
+    writer.append('c.jpg', b'c' * 20)
+    writer.close()
+    reader = open_store(str(tmp_path), reload=True)
+    assert sorted(reader.names()) == ['a.jpg', 'c.jpg']
+    assert bytes(reader.read_bytes('a.jpg')) == b'a' * 10
+    assert bytes(reader.read_bytes('c.jpg')) == b'c' * 20
@@ -0,0 +1,24 @@
+import cv2
+import numpy as np
+
+from photo2video import compute_stabilization
+
+def write_jittered_frames(tmp_path, shifts, size=(320, 240)):
+    # 同一张随机纹理按已知偏移平移，模拟相机抖动
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 256, (size[1] * 2, size[0] * 2, 3), dtype=np.uint8), (5, 5), 0)
+    filenames = []
+    for i, (dx, dy) in enumerate(shifts):
+        x, y = size[0] // 2 - dx, size[1] // 2 - dy
+        name = f"frame_{i:03d}.png"
+        cv2.imwrite(str(tmp_path / name), base[y:y + size[1], x:x + size[0]])
+        filenames.append(name)
+    return filenames
+
+def test_reference_mode_cancels_alternating_jitter(tmp_path):
+    shifts = np.array([(8, -8) if i % 2 else (-8, 8) for i in range(40)])
+    shifts[0] = (0, 0)
+    filenames = write_jittered_frames(tmp_path, shifts)
+    corrections = compute_stabilization(str(tmp_path), filenames, (320, 240), 'reference', workers=2)
+    residual = corrections + (shifts - shifts[0])
+    assert np.abs(residual).max() < 1.5
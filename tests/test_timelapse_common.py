@@ -0,0 +1,12 @@
+import pytest
+
+from timelapse_common import parse_filters
+
+def test_parse_filters():
+    assert parse_filters("luma > 40, sharpness>=-1.5") == [('luma', '>', 40.0), ('sharpness', '>=', -1.5)]
+    assert parse_filters([('mean_r', '<', 3)]) == [('mean_r', '<', 3.0)]
+
+@pytest.mark.parametrize('text', ["luma > 1.2.3", "luma > .", "luma = 4", "brightness > 4"])
+def test_parse_filters_rejects(text):
+    with pytest.raises(ValueError):
+        parse_filters(text)
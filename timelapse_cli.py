@@ -0,0 +1,436 @@
+import time
+_T0 = time.perf_counter()
+import argparse
+import json
+import os
+import re
+import sys
+import timelapse_common
+from timelapse_common import IMAGE_FORMATS
+
+# 命令行入口：capture / render / probe / validate / daemon。
+# 本模块顶层只导入标准库，cv2、numpy 以及拍摄和合成模块在真正需要时才导入，
+# 因此 --help 和配置校验不需要加载 OpenCV。
+
+CONFIG_HELP = """配置文件为JSON，各节的键与命令行参数对应，命令行参数优先：
+{
+  "capture": {"interval": 5, "count": 720, "output_dir": "PhotoOutput", "save_stats": true},
+  "render": {"input_dir": "PhotoOutput", "output_file": "VideoOutput/timelapse_{now}.mp4", "fps": 24},
+  "daemon": {"jobs": [
+    {"task": "capture", "every": 3600},
+    {"task": "render", "at": "23:30", "filters": "luma > 40"}
+  ]}
+}
+daemon 中每个任务可以覆盖对应节的任意键；路径中的 {now} 会替换为开始时间。"""
+
+# 守护进程打不开摄像头时，重试间隔从 CAMERA_RETRY_MIN 秒开始翻倍，最长 CAMERA_RETRY_MAX 秒
+CAMERA_RETRY_MIN = 10
+CAMERA_RETRY_MAX = 600
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f"无效的布尔值: {value}")
+
+def parse_positive(convert):
+    def parse(value):
+        number = convert(value)
+        if number <= 0:
+            raise ValueError(f"必须大于0: {value}")
+        return number
+    return parse
+
+def parse_range(low, high):
+    def parse(value):
+        number = int(value)
+        if not low <= number <= high:
+            raise ValueError(f"应在{low}-{high}之间: {value}")
+        return number
+    return parse
+
+def parse_ints(count, sep):
+    # 接受 "1920x1080" / "0,0,640,480" 形式的字符串或JSON数组
+    def parse(value):
+        if value is None:
+            return None
+        parts = value if isinstance(value, (list, tuple)) else str(value).lower().split(sep)
+        numbers = tuple(int(v) for v in parts)
+        if len(numbers) != count or any(n < 0 for n in numbers):
+            raise ValueError(f"格式错误: {value}")
+        return numbers
+    return parse
+
+def parse_choice(*choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"可选值为 {', '.join(str(c) for c in choices)}: {value}")
+        return value
+    return parse
+
+def parse_filters(value):
+    if value is None:
+        return None
+    items = value if isinstance(value, list) else [f for f in str(value).split(',') if f.strip()]
+    timelapse_common.parse_filters(items)
+    return ', '.join(item.strip() for item in items)
+
+def parse_time_of_day(value):
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', str(value))
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        raise ValueError(f"时间格式应为HH:MM: {value}")
+    return int(match.group(1)), int(match.group(2))
+
+# 各节允许的键及其解析函数，键名与 capture_timelapse / create_timelapse 的参数一致
+CAPTURE_OPTIONS = {
+    'interval': parse_positive(float),
+    'count': parse_positive(int),
+    'output_dir': str,
+    'resolution': parse_ints(2, 'x'),
+    'add_timestamp': parse_bool,
+    'high_rate': parse_bool,
+    'save_stats': parse_bool,
+    'roi': parse_ints(4, ','),
+    'output_size': parse_ints(2, 'x'),
+    'image_format': parse_choice(*IMAGE_FORMATS),
+    'quality': parse_range(1, 100),
+    'storage': parse_choice('files', 'chunks'),
+    'chunk_size': parse_positive(int),
+}
+RENDER_OPTIONS = {
+    'input_dir': str,
+    'output_file': str,
+    'fps': parse_positive(int),
+    'overlay_timestamp': parse_bool,
+    'workers': parse_positive(int),
+    'stabilize': parse_choice(None, 'reference', 'rolling'),
+    'smooth_radius': int,
+    'merge': parse_choice(None, 'mean', 'max', 'decay'),
+    'merge_window': parse_positive(int),
+    'filters': parse_filters,
+}
+SECTION_OPTIONS = {'capture': CAPTURE_OPTIONS, 'render': RENDER_OPTIONS}
+JOB_OPTIONS = {'task': parse_choice('capture', 'render'), 'every': parse_positive(float), 'at': parse_time_of_day}
+
+class ConfigError(ValueError):
+    pass
+
+def validate_section(name, values, options):
+    if not isinstance(values, dict):
+        raise ConfigError(f"[{name}] 应为对象")
+    result = {}
+    for key, value in values.items():
+        if key not in options:
+            raise ConfigError(f"[{name}] 未知的键: {key}")
+        try:
+            result[key] = options[key](value) if value is not None else None
+        except (TypeError, ValueError) as e:
+            raise ConfigError(f"[{name}] {key}: {e}")
+    return result
+
+def validate_config(config):
+    """
+    校验配置并把各值转换为对应类型。
+    返回：
+        校验后的配置字典
+    异常：
+        ConfigError: 配置不合法
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("配置文件顶层应为对象")
+    unknown = set(config) - {'capture', 'render', 'daemon'}
+    if unknown:
+        raise ConfigError(f"未知的配置节: {', '.join(sorted(unknown))}")
+    result = {name: validate_section(name, config.get(name, {}), options)
+              for name, options in SECTION_OPTIONS.items()}
+    daemon = config.get('daemon', {})
+    if not isinstance(daemon, dict) or set(daemon) - {'jobs'}:
+        raise ConfigError("[daemon] 只支持 jobs 列表")
+    jobs = []
+    for i, job in enumerate(daemon.get('jobs', [])):
+        if not isinstance(job, dict) or 'task' not in job:
+            raise ConfigError(f"[daemon.jobs.{i}] 缺少 task")
+        schedule = {k: v for k, v in job.items() if k in JOB_OPTIONS}
+        overrides = {k: v for k, v in job.items() if k not in JOB_OPTIONS}
+        parsed = validate_section(f"daemon.jobs.{i}", schedule, JOB_OPTIONS)
+        if 'every' not in parsed and 'at' not in parsed:
+            raise ConfigError(f"[daemon.jobs.{i}] 需要 every 或 at")
+        parsed['options'] = validate_section(f"daemon.jobs.{i}", overrides, SECTION_OPTIONS[parsed['task']])
+        jobs.append(parsed)
+    result['daemon'] = {'jobs': jobs}
+    return result
+
+def load_config(path):
+    if not path:
+        return validate_config({})
+    try:
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ConfigError(f"无法读取配置文件 {path}: {e}")
+    return validate_config(config)
+
+def merge_options(section, args, options):
+    # 配置文件中的值打底，命令行显式给出的值覆盖
+    merged = dict(section)
+    for key, parse in options.items():
+        value = getattr(args, key, None)
+        if value is not None:
+            try:
+                merged[key] = parse(value)
+            except (TypeError, ValueError) as e:
+                raise ConfigError(f"--{key.replace('_', '-')}: {e}")
+    return merged
+
+def expand_now(options):
+    now = time.strftime("%Y-%m-%d_%H-%M-%S")
+    return {k: v.replace('{now}', now) if isinstance(v, str) else v for k, v in options.items()}
+
+def run_capture(options, log_func=print, stop_event=None, cap=None):
+    from photo_capture import capture_timelapse
+    options = dict(options)
+    missing = [k for k in ('interval', 'count') if k not in options]
+    if missing:
+        raise ConfigError(f"capture 缺少参数: {', '.join(missing)}")
+    interval = options.pop('interval')
+    count = options.pop('count')
+    options.setdefault('output_dir', os.path.join(os.getcwd(), "PhotoOutput"))
+    options.setdefault('high_rate', interval < 1)
+    stats = capture_timelapse(interval, count, log_func=log_func, stop_event=stop_event, cap=cap, **options)
+    return stats is not None
+
+def run_render(options):
+    from photo2video import create_timelapse
+    options = dict(options)
+    missing = [k for k in ('input_dir', 'output_file') if k not in options]
+    if missing:
+        raise ConfigError(f"render 缺少参数: {', '.join(missing)}")
+    input_dir = options.pop('input_dir')
+    output_file = options.pop('output_file')
+    if not os.path.isdir(input_dir):
+        raise ConfigError(f"照片目录不存在: {input_dir}")
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    return create_timelapse(input_dir, output_file, **options)
+
+def open_camera(resolution=None, log_func=print):
+    import cv2
+    cap = cv2.VideoCapture(0)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    if not cap.isOpened():
+        log_func("无法打开摄像头")
+        return None
+    if resolution is not None:
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+    return cap
+
+def run_probe(frames=30, benchmark=None, log_func=print):
+    import cv2
+    from photo_capture import get_supported_resolutions, benchmark_capture
+    cap = open_camera(log_func=log_func)
+    if cap is None:
+        return False
+    try:
+        resolutions = get_supported_resolutions(cap, log_func=log_func)
+        if resolutions:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolutions[-1][0])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolutions[-1][1])
+        cap.read()
+        start = time.perf_counter()
+        got = sum(1 for _ in range(frames) if cap.read()[0])
+        elapsed = time.perf_counter() - start
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        log_func(f"读取速度: {width}x{height} {got / elapsed:.1f} fps（{got}/{frames} 帧）")
+    finally:
+        cap.release()
+    if benchmark:
+        return benchmark_capture(duration=benchmark, log_func=log_func) is not None
+    return True
+
+def next_run_time(job, now):
+    # every：从启动起每隔every秒；at：每天该时刻；两者都有时从at开始每隔every秒
+    if 'at' in job:
+        hour, minute = job['at']
+        first = time.mktime(time.localtime(now)[:3] + (hour, minute, 0, 0, 0, -1))
+        if first <= now:
+            if 'every' in job:
+                return first + ((now - first) // job['every'] + 1) * job['every']
+            first = time.mktime(time.localtime(now + 86400)[:3] + (hour, minute, 0, 0, 0, -1))
+        return first
+    return now
+
+def run_daemon(config, log_func=print):
+    """
+    按配置中的 daemon.jobs 循环执行拍摄和合成任务。
+    cv2 和两个处理模块只导入一次；有拍摄任务时摄像头在任务之间保持打开，
+    空闲时每秒取一帧（不解码），使自动曝光和白平衡始终收敛，任务开始即可拍摄。
+    """
+    import signal
+    import threading
+    jobs = config['daemon']['jobs']
+    if not jobs:
+        raise ConfigError("[daemon] 没有配置任务")
+    # 预先加载，后续任务不再付出导入开销
+    import cv2
+    import photo_capture
+    import photo2video
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    capture_section = config['capture']
+    cap = None
+    # 摄像头打开后的分辨率，没有指定分辨率的任务用它恢复前一个任务改过的分辨率
+    camera_resolution = None
+    camera_retry_at = 0.0
+    camera_retry_delay = CAMERA_RETRY_MIN
+    now = time.time()
+    for i, job in enumerate(jobs):
+        job['name'] = f"daemon.jobs.{i} ({job['task']})"
+        job['next'] = next_run_time(job, now)
+    log_func(f"守护进程已启动，共 {len(jobs)} 个任务（启动耗时 {(time.perf_counter() - _T0) * 1000:.0f} ms）")
+    try:
+        if any(job['task'] == 'capture' for job in jobs):
+            cap = open_camera(capture_section.get('resolution'), log_func)
+            if cap is None:
+                camera_retry_at = time.time() + camera_retry_delay
+        while not stop.is_set():
+            job = min(jobs, key=lambda j: j['next'])
+            wait = job['next'] - time.time()
+            if wait > 0:
+                if cap is not None:
+                    cap.grab()
+                stop.wait(min(wait, 1.0))
+                continue
+            log_func(f"开始任务: {job['name']}")
+            try:
+                if job['task'] == 'capture':
+                    options = expand_now({**capture_section, **job['options']})
+                    if cap is None and time.time() >= camera_retry_at:
+                        # 只在有拍摄任务到期时重新打开，连续失败时逐步拉长间隔
+                        cap = open_camera(capture_section.get('resolution'), log_func)
+                        if cap is None:
+                            camera_retry_delay = min(camera_retry_delay * 2, CAMERA_RETRY_MAX)
+                            camera_retry_at = time.time() + camera_retry_delay
+                        else:
+                            camera_retry_delay = CAMERA_RETRY_MIN
+                    if cap is None:
+                        log_func(f"摄像头不可用，跳过本次拍摄任务（{max(0, camera_retry_at - time.time()):.0f} 秒后才会重试打开）")
+                    else:
+                        if camera_resolution is None:
+                            camera_resolution = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                        options.setdefault('resolution', camera_resolution)
+                        if not run_capture(options, log_func, stop, cap):
+                            # 摄像头可能被拔出，下一个拍摄任务到期时重新打开
+                            cap.release()
+                            cap = None
+                            camera_resolution = None
+                elif not run_render(expand_now({**config['render'], **job['options']})):
+                    log_func(f"任务 {job['name']} 未能生成视频")
+            except ConfigError as e:
+                log_func(f"任务 {job['name']} 配置错误: {e}")
+            except Exception as e:
+                # 单个任务出错（如输出目录无法创建、写文件失败）不应结束守护进程
+                log_func(f"任务 {job['name']} 出错: {type(e).__name__}: {e}")
+            if 'every' in job:
+                job['next'] = max(job['next'] + job['every'], time.time())
+            else:
+                job['next'] = next_run_time(job, time.time() + 1)
+    finally:
+        if cap is not None:
+            cap.release()
+        log_func("守护进程已退出")
+    return True
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="timelapse_cli.py",
+        description="延时摄影命令行：拍摄、合成视频、检测摄像头、按计划常驻运行。",
+        epilog=CONFIG_HELP,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', help="JSON配置文件")
+    parser.add_argument('--timings', action='store_true', help="退出时输出启动和总耗时")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('capture', help="延时拍摄")
+    p.add_argument('--interval', help="拍摄间隔（秒），小于1秒时默认使用高速模式")
+    p.add_argument('--count', help="拍摄次数")
+    p.add_argument('--output-dir', dest='output_dir', help="照片保存目录")
+    p.add_argument('--resolution', help="摄像头分辨率，如1920x1080，默认自动选择")
+    p.add_argument('--no-timestamp', dest='add_timestamp', action='store_const', const=False,
+                   help="不在照片上叠加时间戳（可在合成时叠加）")
+    p.add_argument('--high-rate', dest='high_rate', action='store_const', const=True, help="高速模式")
+    p.add_argument('--stats', dest='save_stats', action='store_const', const=True, help="记录画面统计")
+    p.add_argument('--roi', help="裁剪区域 x,y,宽,高")
+    p.add_argument('--size', dest='output_size', help="保存尺寸，如1280x720")
+    p.add_argument('--format', dest='image_format', help="保存格式：jpg或webp")
+    p.add_argument('--quality', type=int, help="编码质量1-100")
+    p.add_argument('--storage', help="files（每帧一个文件）或chunks（分块存储）")
+    p.add_argument('--chunk-size', dest='chunk_size', help="分块存储每块字节数")
+
+    p = sub.add_parser('render', help="照片合成视频")
+    p.add_argument('--input-dir', dest='input_dir', help="照片目录")
+    p.add_argument('--output', dest='output_file', help="输出视频文件（.mp4）")
+    p.add_argument('--fps', help="视频帧率")
+    p.add_argument('--overlay', dest='overlay_timestamp', action='store_const', const=True,
+                   help="根据文件名中的拍摄时间叠加时间戳")
+    p.add_argument('--workers', help="解码线程数")
+    p.add_argument('--stabilize', help="防抖：reference或rolling")
+    p.add_argument('--smooth-radius', dest='smooth_radius', help="rolling防抖的平滑半径（帧）")
+    p.add_argument('--merge', help="多帧合成：mean、max或decay")
+    p.add_argument('--merge-window', dest='merge_window', help="多帧合成帧数")
+    p.add_argument('--filter', dest='filters', help="按画面统计过滤，如 \"luma>40, sharpness>100\"")
+
+    p = sub.add_parser('probe', help="检测摄像头分辨率和读取帧率")
+    p.add_argument('--frames', type=int, default=30, help="测速读取的帧数")
+    p.add_argument('--benchmark', type=float, metavar='SECONDS', help="再以高速模式测试持续拍摄帧率")
+
+    sub.add_parser('validate', help="只校验配置文件")
+    sub.add_parser('daemon', help="按配置中的 daemon.jobs 常驻运行")
+    return parser
+
+def report_timings(started):
+    now = time.perf_counter()
+    print(f"启动耗时 {(started - _T0) * 1000:.1f} ms，总耗时 {(now - _T0) * 1000:.1f} ms"
+          f"（不含解释器启动，可用 python -X importtime 查看导入细节）", file=sys.stderr)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if '--timings' in argv:
+        import atexit
+        # --help 会在解析参数时直接退出，用atexit保证也能输出
+        atexit.register(lambda: report_timings(started))
+    started = time.perf_counter()
+    args = build_parser().parse_args(argv)
+    try:
+        config = load_config(args.config)
+        if args.command == 'capture':
+            options = expand_now(merge_options(config['capture'], args, CAPTURE_OPTIONS))
+        elif args.command == 'render':
+            options = expand_now(merge_options(config['render'], args, RENDER_OPTIONS))
+        started = time.perf_counter()
+        if args.command == 'validate':
+            print("配置有效")
+            return 0
+        if args.command == 'capture':
+            ok = run_capture(options)
+        elif args.command == 'render':
+            ok = run_render(options)
+        elif args.command == 'probe':
+            ok = run_probe(args.frames, args.benchmark)
+        else:
+            ok = run_daemon(config)
+    except ConfigError as e:
+        print(f"配置错误: {e}", file=sys.stderr)
+        return 2
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+import re
+
+# 拍摄、合成和命令行共用的常量与过滤条件语法。
+# 本模块只依赖标准库，命令行校验配置时不需要加载 cv2。
+
+# 保存格式名称，photo_capture.IMAGE_ENCODERS 中为每个格式给出扩展名和质量参数
+IMAGE_FORMATS = ('jpg', 'webp')
+# 画面统计中的数值列，见 photo_capture.compute_frame_stats
+STATS_COLUMNS = ('luma', 'sharpness', 'mean_b', 'mean_g', 'mean_r')
+FILTER_OPERATORS = ('>=', '<=', '>', '<')
+FILTER_PATTERN = re.compile(r'\s*(\w+)\s*(>=|<=|>|<)\s*([-+]?\d+(?:\.\d+)?)\s*')
+
+def parse_filters(filters):
+    """
+    解析画面统计过滤条件。
+    参数：
+        filters: "luma > 40, sharpness>=100" 这样的字符串，或由此类字符串、(列, 运算符, 值) 组成的列表
+    返回：
+        [(列, 运算符, float值), ...]
+    异常：
+        ValueError: 格式错误、未知的统计列或运算符
+    """
+    if isinstance(filters, str):
+        filters = [f for f in filters.split(',') if f.strip()]
+    parsed = []
+    for item in filters:
+        if isinstance(item, str):
+            match = FILTER_PATTERN.fullmatch(item)
+            if not match:
+                raise ValueError(f"过滤条件格式错误: {item}")
+            column, op, value = match.groups()
+        else:
+            column, op, value = item
+        if column not in STATS_COLUMNS:
+            raise ValueError(f"未知的统计列: {column}（可用: {', '.join(STATS_COLUMNS)}）")
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f"未知的比较运算符: {op}")
+        parsed.append((column, op, float(value)))
+    return parsed